@@ -5,19 +5,72 @@ Records video from webcam to configurable location with customizable settings
 Automatically splits recordings into 5-minute chunks
 """
 
+import os
+
+# libgomp only reads these at load time, so they must be set before importing cv2
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('OMP_DYNAMIC', 'FALSE')
+
 import cv2
+import numpy as np
 import argparse
-import os
+import collections
+import glob
+import queue
+import signal
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
 
-def setup_camera(width, height, fps, camera_index):
-    """Initialize camera with settings"""
-    cap = cv2.VideoCapture(camera_index)
+# Hardware H.264 encoders, in order of preference (Pi4 first, then Pi3/Zero)
+HW_ENCODERS = ['h264_v4l2m2m', 'h264_omx']
+
+# Fragmented MP4 settings for ffmpeg output (fragment duration in microseconds)
+MP4_EXTENSIONS = ('.mp4', '.m4v', '.mov')
+MP4_FRAG_MOVFLAGS = '+frag_keyframe+empty_moov+default_base_moof'
+MP4_FRAG_DURATION = 1000000
+
+# Per-frame overlay work is tiny; thread spawn/join would cost more than it saves
+cv2.setNumThreads(1)
+
+# FourCC codes for the supported OpenCV codecs
+_FOURCC = {
+    "H264": cv2.VideoWriter_fourcc(*'H264'),
+    "MJPG": cv2.VideoWriter_fourcc(*'MJPG'),
+    "XVID": cv2.VideoWriter_fourcc(*'XVID'),
+    "MP4V": cv2.VideoWriter_fourcc(*'mp4v'),
+}
+_DEFAULT_FOURCC = _FOURCC["H264"]
+
+def fourcc_to_str(fourcc):
+    """Decode an integer FourCC code into its four-character name"""
+    return "".join(chr((int(fourcc) >> 8 * i) & 0xFF) for i in range(4))
+
+def setup_camera(width, height, fps, camera_index, input_format='MJPG'):
+    """
+    Initialize camera with settings
+    
+    Args:
+        input_format: Pixel format to request from the camera (MJPG, YUYV or AUTO)
+    """
+    # Use V4L2 directly rather than letting OpenCV pick GStreamer
+    cap = cv2.VideoCapture(camera_index, cv2.CAP_V4L2)
     
     if not cap.isOpened():
         raise Exception(f"Cannot open camera {camera_index}")
     
+    # Keep the driver queue short so frames aren't stale when read
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 2)
+    
+    # Request pixel format before resolution, since the driver picks the
+    # available resolutions/frame rates per format. Uncompressed YUYV at
+    # 1080p30 needs more bandwidth than USB2 provides.
+    if input_format != 'AUTO':
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*input_format))
+    
     # Set resolution
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
@@ -27,33 +80,189 @@ def setup_camera(width, height, fps, camera_index):
     actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     actual_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     actual_fps = cap.get(cv2.CAP_PROP_FPS)
+    actual_format = fourcc_to_str(cap.get(cv2.CAP_PROP_FOURCC))
     
     print(f"Camera initialized:")
+    print(f"  Backend: {cap.getBackendName()}")
     print(f"  Resolution: {actual_width}x{actual_height}")
     print(f"  FPS: {actual_fps}")
+    print(f"  Input Format: {actual_format}")
+    if input_format != 'AUTO' and actual_format != input_format:
+        print(f"  Note: Camera provided {actual_format} instead of requested {input_format}")
     
     return cap
 
 def get_fourcc(codec_name):
     """Get FourCC code for codec"""
-    codec_map = {
-        "H264": cv2.VideoWriter_fourcc(*'H264'),
-        "MJPG": cv2.VideoWriter_fourcc(*'MJPG'),
-        "XVID": cv2.VideoWriter_fourcc(*'XVID'),
-        "MP4V": cv2.VideoWriter_fourcc(*'mp4v'),
-    }
-    return codec_map.get(codec_name, cv2.VideoWriter_fourcc(*'H264'))
+    return _FOURCC.get(codec_name, _DEFAULT_FOURCC)
 
-def create_video_writer(output_dir, width, height, fps, codec, file_format, chunk_number=None):
-    """Create a new video writer with timestamped filename"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+def probe_encoder(encoder):
+    """Check that ffmpeg can actually encode a frame with encoder"""
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-loglevel', 'error',
+             '-f', 'lavfi', '-i', 'color=s=64x64', '-frames:v', '1',
+             '-c:v', encoder, '-f', 'null', '-'],
+            capture_output=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return result.returncode == 0
+
+def detect_hw_encoder():
+    """
+    Return the first hardware H.264 encoder that works on this machine, or None
+    
+    ffmpeg builds list encoders that were compiled in even when the hardware
+    is missing (e.g. h264_v4l2m2m on a Pi 5), so each one is test-encoded.
+    """
+    for encoder in HW_ENCODERS:
+        if probe_encoder(encoder):
+            return encoder
+    return None
+
+class FFmpegWriter:
+    """Video writer that pipes raw BGR frames to an ffmpeg hardware encoder"""
+    
+    def __init__(self, filepath, width, height, fps, encoder, segment_duration, bitrate='4M'):
+        """
+        Args:
+            segment_duration: ffmpeg splits the output into files of this many seconds;
+                              filepath is a pattern with a %03d segment number
+        """
+        output_args = [
+            # Put a keyframe on every boundary so segments split on time
+            '-force_key_frames', f'expr:gte(t,n_forced*{segment_duration})',
+            '-f', 'segment', '-segment_time', str(segment_duration),
+            # Tolerate encoder timestamp offsets so the boundary keyframe is used
+            '-segment_time_delta', '0.05',
+            '-reset_timestamps', '1', '-segment_start_number', '1',
+        ]
+        
+        # Write MP4 as ~1s self-contained fragments: a file cut off by power loss
+        # stays playable, and closing it needs no moov rewrite
+        if os.path.splitext(filepath)[1].lower() in MP4_EXTENSIONS:
+            output_args += ['-segment_format_options',
+                            f'movflags={MP4_FRAG_MOVFLAGS}:frag_duration={MP4_FRAG_DURATION}']
+        
+        self.proc = subprocess.Popen(
+            ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+             '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+             '-s', f'{width}x{height}', '-r', f'{fps:.2f}', '-i', '-',
+             '-c:v', encoder, '-b:v', bitrate,
+             *output_args,
+             filepath],
+            stdin=subprocess.PIPE,
+            # Keep Ctrl+C / systemd stop away from ffmpeg; it finishes when
+            # release() closes its stdin
+            start_new_session=True
+        )
+    
+    def isOpened(self):
+        return self.proc.poll() is None
+    
+    def write(self, frame):
+        try:
+            self.proc.stdin.write(frame.data)
+        except BrokenPipeError:
+            raise Exception(f"ffmpeg exited with code {self.proc.wait()}") from None
+    
+    def release(self):
+        if self.proc.stdin.closed:
+            return
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass  # ffmpeg already exited; reported below
+        if self.proc.wait() != 0:
+            raise Exception(f"ffmpeg exited with code {self.proc.returncode}")
+
+class ThreadedWriter:
+    """Encode frames on a background thread so capture never waits on the encoder"""
+    
+    def __init__(self, writer, max_queue=8, on_written=None):
+        """
+        Args:
+            on_written: Called from the writer thread with each frame once it is encoded,
+                        so the caller can reuse the buffer
+        """
+        self.writer = writer
+        self.on_written = on_written
+        self.dropped = 0
+        self.error = None  # Exception from the writer thread, re-raised to the caller once
+        self.error_raised = False
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.thread.start()
+    
+    def _writer_loop(self):
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is None:
+                    break
+                self.writer.write(frame)
+                if self.on_written is not None:
+                    self.on_written(frame)
+        except Exception as e:
+            self.error = e
+    
+    def isOpened(self):
+        return self.writer.isOpened()
+    
+    def write(self, frame):
+        """Queue a frame for encoding, dropping it if the encoder is behind"""
+        if self.error is not None:
+            self.error_raised = True
+            raise self.error
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+    
+    def release(self):
+        # The thread may die with a full queue, so don't block on the sentinel
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.thread.join()
+        
+        try:
+            self.writer.release()
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+        if self.error is not None and not self.error_raised:
+            self.error_raised = True
+            raise self.error
+
+def file_timestamp():
+    """Current local time formatted for recording filenames (YYYYMMDD_HHMMSS)"""
+    t = time.localtime()
+    return (f"{t.tm_year:04d}{t.tm_mon:02d}{t.tm_mday:02d}_"
+            f"{t.tm_hour:02d}{t.tm_min:02d}{t.tm_sec:02d}")
+
+def create_video_writer(output_dir, width, height, fps, codec, file_format, chunk_number=None,
+                        on_written=None):
+    """
+    Create a new OpenCV video writer with timestamped filename
+    
+    Args:
+        on_written: Passed to ThreadedWriter, called with each frame once it is encoded
+    """
+    timestamp = file_timestamp()
     
     if chunk_number is not None:
         filename = f"recording_{timestamp}_part{chunk_number:03d}.{file_format}"
     else:
         filename = f"recording_{timestamp}.{file_format}"
     
-    filepath = os.path.join(output_dir, filename)
+    filepath = f"{output_dir.rstrip(os.sep)}{os.sep}{filename}"
     
     fourcc = get_fourcc(codec)
     out = cv2.VideoWriter(filepath, fourcc, fps, (width, height))
@@ -61,22 +270,340 @@ def create_video_writer(output_dir, width, height, fps, codec, file_format, chun
     if not out.isOpened():
         raise Exception(f"Failed to initialize video writer for {filepath}")
     
-    return out, filepath
+    return ThreadedWriter(out, on_written=on_written), filepath
+
+def create_segmented_writer(output_dir, width, height, fps, file_format, encoder,
+                            chunk_duration, on_written=None):
+    """
+    Create a single ffmpeg writer that splits the recording into chunks itself
+    
+    Returns the writer and the pattern ffmpeg uses for chunk filenames
+    (recording_<start time>_part%03d.<format>, numbered from 1)
+    """
+    filename = f"recording_{file_timestamp()}_part%03d.{file_format}"
+    filepath = f"{output_dir.rstrip(os.sep)}{os.sep}{filename}"
+    
+    out = FFmpegWriter(filepath, width, height, fps, encoder, segment_duration=chunk_duration)
+    
+    if not out.isOpened():
+        raise Exception(f"Failed to initialize video writer for {filepath}")
+    
+    return ThreadedWriter(out, on_written=on_written), filepath
+
+class ChunkedRecording:
+    """Recording state, advanced one frame at a time and split into chunks"""
+    
+    # How long before a chunk boundary to open the next chunk's writer
+    PREOPEN_SECONDS = 0.5
+    
+    def __init__(self, cap, output_dir, width, height, fps, codec, file_format,
+                 encoder=None, duration=None, chunk_duration=300):
+        self.cap = cap
+        self.output_dir = output_dir
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.codec = codec
+        self.file_format = file_format
+        self.duration = duration
+        self.chunk_duration = chunk_duration
+        
+        # A hardware encoder runs as one ffmpeg process that splits chunks
+        # itself, by frame timestamps we don't track, so there's no per-chunk
+        # bookkeeping; otherwise a new writer is opened for each chunk
+        self.segmented = bool(encoder) and codec == 'H264'
+        if self.segmented:
+            self.preopen_at = float('inf')
+        else:
+            self.preopen_at = chunk_duration - self.PREOPEN_SECONDS
+        
+        self.frame_count = 0
+        self.chunk_number = 1
+        self.chunk_frame_count = 0
+        self.total_dropped = 0
+        
+        # Timestamp overlay layout is fixed for the resolution, so compute it once
+        self.font = cv2.FONT_HERSHEY_SIMPLEX
+        self.font_scale = 0.7
+        self.font_thickness = 2
+        self.text_color = (255, 255, 255)  # White
+        self.bg_color = (0, 0, 0)  # Black background
+        
+        (text_width, text_height), baseline = cv2.getTextSize(
+            "0000-00-00 00:00:00", self.font, self.font_scale, self.font_thickness
+        )
+        # Background rectangle as a slice of the frame (corners inclusive, like
+        # cv2.rectangle), clipped to the frame so small resolutions still fit
+        banner_top = max(0, height - text_height - baseline - 10)
+        banner_right = min(width, 10 + text_width + 11)
+        self.banner = (slice(banner_top, height - 4), slice(10, banner_right))
+        # Text origin relative to the banner's top-left corner
+        self.text_org = (5, height - baseline - 8 - banner_top)
+        
+        # Timestamp text only changes once a second, so render the whole banner
+        # then and just copy it into each frame
+        self.banner_image = np.empty((height - 4 - banner_top, banner_right - 10, 3), np.uint8)
+        self.last_sec = 0
+        
+        # Frame buffers are recycled once the writer thread has encoded them,
+        # instead of allocating a new full-size array for every frame
+        self.free_frames = collections.deque()
+        
+        # Writers for the next chunk are opened, and finished ones released,
+        # in the background so rollover doesn't stall capture
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.next_writer = None
+        self.releases = []
+        
+        # Create first video writer
+        if self.segmented:
+            self.out, self.current_filepath = create_segmented_writer(
+                output_dir, width, height, fps, file_format, encoder,
+                chunk_duration, self.free_frames.append
+            )
+            print(f"\nChunks: {self.current_filepath}")
+        else:
+            self.out, self.current_filepath = self._create_writer(self.chunk_number)
+            print(f"\nChunk {self.chunk_number}: {self.current_filepath}")
+        
+        self.total_start_time = time.monotonic()
+        self.chunk_start_time = self.total_start_time
+        self.next_progress_time = self.total_start_time + 1.0
+    
+    def _create_writer(self, chunk_number):
+        return create_video_writer(
+            self.output_dir, self.width, self.height, self.fps,
+            self.codec, self.file_format, chunk_number,
+            self.free_frames.append
+        )
+    
+    def _prepare_next_writer(self):
+        """Start opening the next chunk's writer, unless this is the last chunk"""
+        chunk_end = self.chunk_start_time - self.total_start_time + self.chunk_duration
+        if self.duration and chunk_end >= self.duration:
+            return
+        self.next_writer = self.executor.submit(self._create_writer, self.chunk_number + 1)
+    
+    def step(self):
+        """
+        Capture, timestamp and write one frame
+        
+        Returns:
+            The recorded frame, or None when recording should stop
+        """
+        if self.free_frames:
+            frame = self.free_frames.pop()
+        else:
+            frame = np.empty((self.height, self.width, 3), np.uint8)
+        
+        ret = self.cap.grab()
+        if ret:
+            ret, frame = self.cap.retrieve(frame)
+        
+        if not ret:
+            print("Failed to capture frame")
+            return None
+        
+        # Add timestamp overlay to frame
+        sec = int(time.time())
+        if sec != self.last_sec:
+            self._render_banner(datetime.fromtimestamp(sec).strftime("%Y-%m-%d %H:%M:%S"))
+            self.last_sec = sec
+        
+        frame[self.banner] = self.banner_image
+        
+        # Write frame to current video file; a dropped frame's buffer is free right away
+        try:
+            written = self.out.write(frame)
+        except Exception:
+            return None  # Writer failed; kept in self.out.error and reported by finish()
+        if not written:
+            self.free_frames.append(frame)
+        self.frame_count += 1
+        self.chunk_frame_count += 1
+        
+        # Check if chunk duration reached, opening the next writer just before
+        now = time.monotonic()
+        chunk_elapsed = now - self.chunk_start_time
+        if chunk_elapsed >= self.preopen_at:
+            if chunk_elapsed >= self.chunk_duration:
+                if not self._next_chunk(chunk_elapsed):
+                    return None
+                # now predates the new chunk's start; skip progress until next second
+                self.next_progress_time = now + 1.0
+            elif self.next_writer is None:
+                self._prepare_next_writer()
+        
+        # Check total duration limit
+        total_elapsed = now - self.total_start_time
+        if self.duration and total_elapsed >= self.duration:
+            return None
+        
+        # Print progress once a second
+        if now >= self.next_progress_time:
+            self._print_progress(now)
+            self.next_progress_time = now + 1.0
+        
+        return frame
+    
+    def _render_banner(self, text):
+        """Draw the timestamp text on a black background into banner_image"""
+        self.banner_image[:] = self.bg_color
+        cv2.putText(
+            self.banner_image,
+            text,
+            self.text_org,
+            self.font,
+            self.font_scale,
+            self.text_color,
+            self.font_thickness,
+            cv2.LINE_AA
+        )
+    
+    def _print_progress(self, now):
+        if self.segmented:
+            sys.stdout.write(f"Recording: {self.frame_count} frames, "
+                             f"{now - self.total_start_time:.1f}s\r")
+            sys.stdout.flush()
+            return
+        chunk_elapsed = now - self.chunk_start_time
+        chunk_remaining = self.chunk_duration - chunk_elapsed
+        sys.stdout.write(f"Chunk {self.chunk_number}: {self.chunk_frame_count} frames, "
+                         f"{chunk_elapsed:.1f}s/{self.chunk_duration}s "
+                         f"({chunk_remaining:.0f}s remaining) | "
+                         f"Total: {self.frame_count} frames, {now - self.total_start_time:.1f}s\r")
+        sys.stdout.flush()
+    
+    def _next_chunk(self, chunk_elapsed):
+        """Close the current chunk and start the next one. Returns False if recording is done"""
+        chunk_dropped = self.out.dropped
+        print(f"\nChunk {self.chunk_number} complete:")
+        print(f"  Duration: {chunk_elapsed:.1f}s")
+        print(f"  Frames: {self.chunk_frame_count}")
+        print(f"  Dropped: {chunk_dropped}")
+        print(f"  File: {self.current_filepath}")
+        
+        # Check if total duration is specified and reached; finish() closes the chunk
+        total_elapsed = time.monotonic() - self.total_start_time
+        if self.duration and total_elapsed >= self.duration:
+            return False
+        
+        # Stop if the next chunk's writer couldn't be opened; finish() reports why
+        if self.next_writer is None:
+            self._prepare_next_writer()
+        if self.next_writer.exception() is not None:
+            return False
+        
+        self.total_dropped += chunk_dropped
+        self.chunk_number += 1
+        self.chunk_frame_count = 0
+        self.chunk_start_time = time.monotonic()
+        
+        # Switch to the next chunk's writer and finalize the old one in the background
+        old_out = self.out
+        self.out, self.current_filepath = self.next_writer.result()
+        self.next_writer = None
+        self.releases.append(self.executor.submit(old_out.release))
+        
+        print(f"\nChunk {self.chunk_number}: {self.current_filepath}")
+        return True
+    
+    def finish(self):
+        """
+        Close the current chunk and print a summary of the recording
+        
+        Returns:
+            True if every chunk was written successfully
+        """
+        total_elapsed = time.monotonic() - self.total_start_time
+        chunk_elapsed = time.monotonic() - self.chunk_start_time
+        
+        try:
+            self.out.release()
+        except Exception:
+            pass  # Kept in self.out.error and reported below
+        
+        # Discard a writer opened for a chunk that never started
+        unused_error = None
+        if self.next_writer is not None:
+            try:
+                unused_out, unused_filepath = self.next_writer.result()
+                unused_out.release()
+                os.remove(unused_filepath)
+            except Exception as e:
+                unused_error = e
+        self.executor.shutdown(wait=True)
+        
+        error = self.out.error
+        for release in self.releases:
+            if error is None:
+                error = release.exception()
+        if error is None:
+            error = unused_error
+        
+        chunk_dropped = self.out.dropped
+        
+        print(f"\n\n{'='*60}")
+        if error is None:
+            print(f"Recording complete:")
+        else:
+            print(f"Recording failed: {error}")
+        print(f"  Total Duration: {total_elapsed:.1f}s")
+        print(f"  Total Frames: {self.frame_count}")
+        print(f"  Dropped Frames: {self.total_dropped + chunk_dropped}")
+        print(f"  Average FPS: {self.frame_count/total_elapsed:.2f}")
+        if self.segmented:
+            # ffmpeg decided the chunk boundaries, so count what it actually wrote
+            prefix, suffix = self.current_filepath.split('%03d')
+            chunk_files = glob.glob(glob.escape(prefix) + '[0-9]*' + glob.escape(suffix))
+            print(f"  Total Chunks: {len(chunk_files)}")
+            print(f"  Files: {self.current_filepath}")
+        else:
+            print(f"  Total Chunks: {self.chunk_number}")
+            print(f"\nFinal chunk {self.chunk_number}:")
+            print(f"  Duration: {chunk_elapsed:.1f}s")
+            print(f"  Frames: {self.chunk_frame_count}")
+            print(f"  Dropped: {chunk_dropped}")
+            print(f"  File: {self.current_filepath}")
+        print(f"{'='*60}")
+        
+        return error is None
+
+def _loop_headless(recording):
+    """Record until done; no preview window or key polling"""
+    while recording.step() is not None:
+        pass
+
+def _loop_preview(recording):
+    """Record until done or 'q' is pressed, showing a preview window"""
+    while True:
+        frame = recording.step()
+        if frame is None:
+            break
+        
+        cv2.imshow('Recording (press q to stop)', frame)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
 
 def record_video(output_dir, width, height, fps, codec, file_format, camera_index, 
-                duration=None, headless=False, chunk_duration=300):
+                duration=None, headless=False, chunk_duration=300, encoder=None,
+                input_format='MJPG'):
     """
     Record video with given configuration, splitting into chunks
     
+    Returns True if every chunk was written successfully
+    
     Args:
         chunk_duration: Duration of each chunk in seconds (default: 300 = 5 minutes)
+        encoder: ffmpeg hardware encoder for H264, or None for cv2.VideoWriter
+        input_format: Pixel format to request from the camera (MJPG, YUYV or AUTO)
     """
     
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
     
     # Initialize camera first
-    cap = setup_camera(width, height, fps, camera_index)
+    cap = setup_camera(width, height, fps, camera_index, input_format)
     
     # Get actual resolution
     actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -85,159 +612,52 @@ def record_video(output_dir, width, height, fps, codec, file_format, camera_inde
     if actual_width != width or actual_height != height:
         print(f"  Note: Camera provided {actual_width}x{actual_height} instead of requested {width}x{height}")
     
-    # Measure actual FPS by capturing test frames
+    # Measure actual FPS by grabbing test frames (grab() skips decoding them)
     print("  Measuring actual camera frame rate...")
     test_frames = 60
+    grabbed = 0
     start_time = time.time()
     for _ in range(test_frames):
-        ret, _ = cap.read()
-        if not ret:
+        if not cap.grab():
             break
+        grabbed += 1
     elapsed = time.time() - start_time
-    measured_fps = test_frames / elapsed if elapsed > 0 else fps
+    measured_fps = grabbed / elapsed if grabbed and elapsed > 0 else fps
     
     print(f"  Measured FPS: {measured_fps:.1f}")
     
     print(f"\nRecording will be split into {chunk_duration//60} minute chunks")
-    print(f"Press 'q' to stop recording")
+    if headless:
+        print(f"Press Ctrl+C to stop recording")
+    else:
+        print(f"Press 'q' to stop recording")
     if duration:
         print(f"Total recording duration: {duration} seconds")
     
-    frame_count = 0
-    chunk_number = 1
-    chunk_frame_count = 0
-    total_start_time = datetime.now()
-    chunk_start_time = datetime.now()
-    
-    # Create first video writer
-    out, current_filepath = create_video_writer(
-        output_dir, actual_width, actual_height, measured_fps, 
-        codec, file_format, chunk_number
+    recording = ChunkedRecording(
+        cap, output_dir, actual_width, actual_height, measured_fps,
+        codec, file_format, encoder, duration, chunk_duration
     )
-    print(f"\nChunk {chunk_number}: {current_filepath}")
+    
+    # headless is fixed for the whole run, so pick a loop without the preview branch
+    capture_loop = _loop_headless if headless else _loop_preview
+    
+    # Stop cleanly on SIGTERM (systemd stop, kill) just like Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
     
     try:
-        while True:
-            ret, frame = cap.read()
-            
-            if not ret:
-                print("Failed to capture frame")
-                break
-            
-            # Add timestamp overlay to frame
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            font_scale = 0.7
-            font_thickness = 2
-            text_color = (255, 255, 255)  # White
-            bg_color = (0, 0, 0)  # Black background
-            
-            # Get text size for background rectangle
-            (text_width, text_height), baseline = cv2.getTextSize(
-                current_time, font, font_scale, font_thickness
-            )
-            
-            # Draw black background rectangle
-            cv2.rectangle(
-                frame,
-                (10, frame.shape[0] - text_height - baseline - 10),
-                (10 + text_width + 10, frame.shape[0] - 5),
-                bg_color,
-                -1  # Filled rectangle
-            )
-            
-            # Draw timestamp text
-            cv2.putText(
-                frame,
-                current_time,
-                (15, frame.shape[0] - baseline - 8),
-                font,
-                font_scale,
-                text_color,
-                font_thickness,
-                cv2.LINE_AA
-            )
-            
-            # Write frame to current video file
-            out.write(frame)
-            frame_count += 1
-            chunk_frame_count += 1
-            
-            # Show preview unless headless
-            if not headless:
-                cv2.imshow('Recording (press q to stop)', frame)
-            
-            # Check for quit (only if showing preview)
-            if not headless and cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-            
-            # Check if chunk duration reached
-            chunk_elapsed = (datetime.now() - chunk_start_time).total_seconds()
-            if chunk_elapsed >= chunk_duration:
-                # Close current video writer
-                chunk_duration_actual = (datetime.now() - chunk_start_time).total_seconds()
-                print(f"\nChunk {chunk_number} complete:")
-                print(f"  Duration: {chunk_duration_actual:.1f}s")
-                print(f"  Frames: {chunk_frame_count}")
-                print(f"  File: {current_filepath}")
-                
-                out.release()
-                
-                # Check if total duration is specified and reached
-                total_elapsed = (datetime.now() - total_start_time).total_seconds()
-                if duration and total_elapsed >= duration:
-                    break
-                
-                # Create new video writer for next chunk
-                chunk_number += 1
-                chunk_frame_count = 0
-                chunk_start_time = datetime.now()
-                
-                out, current_filepath = create_video_writer(
-                    output_dir, actual_width, actual_height, measured_fps, 
-                    codec, file_format, chunk_number
-                )
-                print(f"\nChunk {chunk_number}: {current_filepath}")
-            
-            # Check total duration limit
-            if duration:
-                total_elapsed = (datetime.now() - total_start_time).total_seconds()
-                if total_elapsed >= duration:
-                    break
-            
-            # Print progress every 30 frames
-            if frame_count % 30 == 0:
-                total_elapsed = (datetime.now() - total_start_time).total_seconds()
-                chunk_elapsed = (datetime.now() - chunk_start_time).total_seconds()
-                chunk_remaining = chunk_duration - chunk_elapsed
-                print(f"Chunk {chunk_number}: {chunk_frame_count} frames, "
-                      f"{chunk_elapsed:.1f}s/{chunk_duration}s "
-                      f"({chunk_remaining:.0f}s remaining) | "
-                      f"Total: {frame_count} frames, {total_elapsed:.1f}s", end='\r')
+        capture_loop(recording)
     
     except KeyboardInterrupt:
-        print("\n\nRecording interrupted by user")
+        print("\n\nRecording interrupted")
     
     finally:
         # Cleanup
-        total_elapsed = (datetime.now() - total_start_time).total_seconds()
-        chunk_elapsed = (datetime.now() - chunk_start_time).total_seconds()
-        
-        print(f"\n\n{'='*60}")
-        print(f"Recording complete:")
-        print(f"  Total Duration: {total_elapsed:.1f}s")
-        print(f"  Total Frames: {frame_count}")
-        print(f"  Average FPS: {total_elapsed/frame_count:.2f}")
-        print(f"  Total Chunks: {chunk_number}")
-        print(f"\nFinal chunk {chunk_number}:")
-        print(f"  Duration: {chunk_elapsed:.1f}s")
-        print(f"  Frames: {chunk_frame_count}")
-        print(f"  File: {current_filepath}")
-        print(f"{'='*60}")
-        
+        ok = recording.finish()
         cap.release()
-        out.release()
         cv2.destroyAllWindows()
+    
+    return ok
 
 def main():
     parser = argparse.ArgumentParser(
@@ -260,6 +680,10 @@ def main():
                        default='H264',
                        choices=['H264', 'MJPG', 'XVID', 'MP4V'],
                        help='Video codec')
+    parser.add_argument('--encoder',
+                       default='auto',
+                       choices=['auto', 'none'] + HW_ENCODERS,
+                       help='ffmpeg hardware encoder for H264 (auto = detect, none = use OpenCV)')
     parser.add_argument('--format',
                        default='mp4',
                        help='Output file format')
@@ -267,6 +691,14 @@ def main():
                        type=int,
                        default=0,
                        help='Camera device index')
+    parser.add_argument('--input-format',
+                       default='MJPG',
+                       choices=['MJPG', 'YUYV', 'AUTO'],
+                       help='Pixel format to request from the camera')
+    parser.add_argument('--cv-threads',
+                       type=int,
+                       default=1,
+                       help='Number of threads OpenCV may use')
     parser.add_argument('--chunk-duration',
                        type=int,
                        default=300,
@@ -298,6 +730,8 @@ def main():
         print(f"Error: Invalid resolution format '{args.resolution}'. Use WIDTHxHEIGHT (e.g., 1920x1080)")
         return 1
     
+    cv2.setNumThreads(args.cv_threads)
+    
     # Validate chunk duration
     if args.chunk_duration < 10:
         print("Error: Chunk duration must be at least 10 seconds")
@@ -312,7 +746,7 @@ def main():
     # Test mode
     if args.test:
         print(f"Testing camera {args.camera} at {width}x{height} @ {args.fps}fps...")
-        cap = setup_camera(width, height, args.fps, args.camera)
+        cap = setup_camera(width, height, args.fps, args.camera, args.input_format)
         
         if args.headless:
             print("Capturing test frame...")
@@ -334,13 +768,26 @@ def main():
         cap.release()
         return 0
     
+    # Pick hardware encoder
+    if args.encoder == 'auto':
+        encoder = detect_hw_encoder()
+    elif args.encoder == 'none':
+        encoder = None
+    elif probe_encoder(args.encoder):
+        encoder = args.encoder
+    else:
+        print(f"Error: ffmpeg encoder '{args.encoder}' is not usable on this machine")
+        return 1
+    
     # Record video
     print(f"Starting recording:")
     print(f"  Output: {args.output}")
     print(f"  Resolution: {width}x{height}")
     print(f"  FPS: {args.fps}")
     print(f"  Codec: {args.codec}")
-    print(f"  Camera: {args.camera}")
+    if args.codec == 'H264':
+        print(f"  Encoder: {encoder or 'OpenCV (software)'}")
+    print(f"  Camera: {args.camera} ({args.input_format})")
     print(f"  Chunk Duration: {args.chunk_duration}s ({args.chunk_duration//60} minutes)")
     if args.duration:
         num_chunks = (args.duration + args.chunk_duration - 1) // args.chunk_duration
@@ -350,7 +797,7 @@ def main():
     if args.headless:
         print(f"  Mode: Headless (no preview)")
     
-    record_video(
+    ok = record_video(
         args.output,
         width,
         height,
@@ -360,10 +807,12 @@ def main():
         args.camera,
         args.duration,
         args.headless,
-        args.chunk_duration
+        args.chunk_duration,
+        encoder,
+        args.input_format
     )
     
-    return 0
+    return 0 if ok else 1
 
 if __name__ == "__main__":
     exit(main())
\ No newline at end of file
@@ -5,6 +5,7 @@ import time
 from pylitterbot import Account, enums
 from datetime import datetime
 import json
+import random
 import sys
 import os
 
@@ -20,11 +21,34 @@ def get_time(t=None, frac=True):
 def log(msg):
     print(f'{get_time(None, False)}: {msg}')
 
+async def handle_robot(robot, clean_cycle) -> bool:
+    """Refresh one robot, start a clean if due and reset it if stuck. Returns True if cleaned"""
+    cleaned = False
+    await robot.refresh()
+    
+    if clean_cycle and robot.status != enums.LitterBoxStatus.CLEAN_CYCLE:
+        await robot.start_cleaning()
+        log(f'Clean: {robot.name}')
+        cleaned = True
+        # Wait a bit before checking status
+        await asyncio.sleep(5)
+    
+    # Check status after potential cleaning
+    await robot.refresh()
+    stat = robot.status
+    
+    if stat == enums.LitterBoxStatus.PAUSED or stat == enums.LitterBoxStatus.CAT_SENSOR_INTERRUPTED:
+        await robot.reset()
+        log(f'Reset: {robot.name}')
+    
+    return cleaned
+
 async def main(user, pas) -> None:
     reset_mins = 10
     clean_hrs = 8
     max_retries = 3
     retry_count = 0
+    backoff_count = 0  # Consecutive max-retry waits, for exponential backoff
     
     # Validate configuration
     if reset_mins < 1:
@@ -34,52 +58,63 @@ async def main(user, pas) -> None:
     check_interval = int(clean_hrs/(reset_mins/60))
     i = check_interval - 1  # Start with a clean
     
-    while True:
-        account = Account()
-        try:
-            log("Connect")
-            await account.connect(
-                username=user, password=pas, load_robots=True, load_pets=True
-            )
-            retry_count = 0  # Reset on successful connection
-            
-            log("Check")
-            i += 1
-            
-            for robot in account.robots:
-                await robot.refresh()
-                
-                # Clean robot every clean_hrs hours
-                if i % check_interval == 0 and robot.status != enums.LitterBoxStatus.CLEAN_CYCLE:
-                    await robot.start_cleaning()
-                    log(f'Clean: {robot.name}')
-                    i = 0
-                    # Wait a bit before checking status
-                    await asyncio.sleep(5)
+    # Keep one session across cycles; only reconnect after a failure
+    account = None
+    try:
+        while True:
+            try:
+                if account is None:
+                    log("Connect")
+                    account = Account()
+                    await account.connect(
+                        username=user, password=pas, load_robots=True, load_pets=True
+                    )
+                retry_count = 0  # Reset on successful connection
+                backoff_count = 0
                 
-                # Check status after potential cleaning
-                await robot.refresh()
-                stat = robot.status
+                log("Check")
+                i += 1
                 
-                if stat == enums.LitterBoxStatus.PAUSED or stat == enums.LitterBoxStatus.CAT_SENSOR_INTERRUPTED:
-                    await robot.reset()
-                    log(f'Reset: {robot.name}')
+                # Clean robots every clean_hrs hours; handle all robots concurrently
+                clean_cycle = i % check_interval == 0
+                # Let every robot finish before raising, so a failure doesn't
+                # disconnect the account while other robots are mid-request
+                results = await asyncio.gather(
+                    *(handle_robot(robot, clean_cycle) for robot in account.robots),
+                    return_exceptions=True
+                )
+                if any(result is True for result in results):
+                    i = 0
+                for result in results:
+                    if isinstance(result, BaseException):
+                        raise result
+            except Exception as e:
+                retry_count += 1
+                log(f"Error: {e}")
+                # Drop the session so the next cycle reconnects from scratch
+                if account is not None:
+                    log("Disconnect")
+                    try:
+                        await account.disconnect()
+                    except:
+                        pass  # Already disconnected or error
+                    account = None
+                if retry_count >= max_retries:
+                    # Back off exponentially from 5 minutes up to an hour, with jitter
+                    delay = min(60 * 5 * 2 ** backoff_count, 60 * 60) + random.uniform(0, 30)
+                    log(f"Max retries ({max_retries}) reached. Waiting {delay / 60:.1f} minutes before retry...")
+                    await asyncio.sleep(delay)
+                    backoff_count += 1
+                    retry_count = 0
                     
-        except Exception as e:
-            retry_count += 1
-            log(f"Error: {e}")
-            if retry_count >= max_retries:
-                log(f"Max retries ({max_retries}) reached. Waiting before retry...")
-                time.sleep(60 * 5)  # Wait 5 minutes on repeated failures
-                retry_count = 0
-        finally:
+            await asyncio.sleep(60 * reset_mins)
+    finally:
+        if account is not None:
             log("Disconnect")
             try:
                 await account.disconnect()
             except:
                 pass  # Already disconnected or error
-                
-        time.sleep(60 * reset_mins)
 
 if __name__ == "__main__":
     # Check if account_info.json exists